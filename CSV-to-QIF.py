@@ -15,13 +15,129 @@
 
 
 from datetime import datetime
-from io import StringIO
 import locale
 import os
 import sys
 import csv
+import collections
+import difflib
+import functools
+import operator
 import json
 import argparse
+import tempfile
+
+# CSV column indices used by SecurityRecord
+SecurityColumns = collections.namedtuple("SecurityColumns", ("type", "symbol", "security", "goal"))
+
+def parse_numeric_date(text, sep, year_at, month_at, day_at, year_digits):
+    """
+    Fast path for an all-number CSV date, e.g. 12/31/2024 for "%m/%d/%Y".
+
+    Args:
+        text (string): Date from the CSV.
+        sep (string): Separator between the numbers.
+        year_at, month_at, day_at (int): Position of each number in the date.
+        year_digits (int): 4 for a %Y year, 2 for a %y year.
+
+    Returns:
+        datetime: The date, or None when the text is not a plain number date
+                  and needs datetime.strptime() (which reports any error).
+    """
+    parts = text.split(sep)
+    if len(parts) != 3:
+        return None
+    for part in parts:
+        if not (part.isascii() and part.isdigit()):
+            return None
+    year, month, day = parts[year_at], parts[month_at], parts[day_at]
+    if len(year) != year_digits or len(month) > 2 or len(day) > 2:
+        return None
+    year = int(year)
+    if year_digits == 2:
+        year += 1900 if year >= 69 else 2000 # same century rule as strptime %y
+    try:
+        return datetime(year, int(month), int(day))
+    except ValueError:
+        return None
+
+def parse_iso_date(text, zoned):
+    """
+    Fast path for ISO 8601 CSV dates using datetime.fromisoformat().
+    fromisoformat() takes more shapes than strptime() does for the format
+    (no seconds, a space for the T, fractions), so only the exact
+    2024-01-05T10:00:00 shape (plus a +0500 or +05:00 zone) is passed to it.
+
+    Args:
+        text (string): Date from the CSV.
+        zoned (bool): True if the CsvTimeFormat ends with a %z time zone.
+
+    Returns:
+        datetime: The date, or None when the text needs datetime.strptime().
+    """
+    if zoned:
+        if len(text) == 24:
+            zone = text[20:]
+        elif len(text) == 25 and text[22] == ':':
+            zone = text[20:22] + text[23:]
+        else:
+            return None
+        # strptime() only takes 00-59 for the zone minutes
+        if text[19] not in "+-" or not (zone.isascii() and zone.isdigit()) or zone[2] > '5':
+            return None
+    elif len(text) != 19:
+        return None
+    digits = text[0:4] + text[5:7] + text[8:10] + text[11:13] + text[14:16] + text[17:19]
+    if text[4] != '-' or text[7] != '-' or text[10] != 'T' or text[13] != ':' or text[16] != ':' \
+        or not (digits.isascii() and digits.isdigit()):
+        return None
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+# CsvTimeFormat entries that can skip datetime.strptime()
+fast_date_parsers = {
+    "%m/%d/%Y": functools.partial(parse_numeric_date, sep="/", year_at=2, month_at=0, day_at=1, year_digits=4),
+    "%m/%d/%y": functools.partial(parse_numeric_date, sep="/", year_at=2, month_at=0, day_at=1, year_digits=2),
+    "%d/%m/%Y": functools.partial(parse_numeric_date, sep="/", year_at=2, month_at=1, day_at=0, year_digits=4),
+    "%d/%m/%y": functools.partial(parse_numeric_date, sep="/", year_at=2, month_at=1, day_at=0, year_digits=2),
+    "%Y-%m-%d": functools.partial(parse_numeric_date, sep="-", year_at=0, month_at=1, day_at=2, year_digits=4),
+    "%Y/%m/%d": functools.partial(parse_numeric_date, sep="/", year_at=0, month_at=1, day_at=2, year_digits=4),
+}
+if sys.version_info >= (3, 11):
+    # fromisoformat() only reads these (e.g. a -0500 offset) from Python 3.11
+    fast_date_parsers["%Y-%m-%dT%H:%M:%S%z"] = functools.partial(parse_iso_date, zoned=True)
+    fast_date_parsers["%Y-%m-%dT%H:%M:%S"] = functools.partial(parse_iso_date, zoned=False)
+
+# QifTimeFormat entries that can skip datetime.strftime()
+fast_date_formatters = {
+    "%m/%d/%Y": lambda d: f"{d.month:02d}/{d.day:02d}/{d.year}",
+    "%m/%d/%y": lambda d: f"{d.month:02d}/{d.day:02d}/{d.year % 100:02d}",
+    "%d/%m/%Y": lambda d: f"{d.day:02d}/{d.month:02d}/{d.year}",
+    "%d/%m/%y": lambda d: f"{d.day:02d}/{d.month:02d}/{d.year % 100:02d}",
+    "%Y-%m-%d": lambda d: f"{d.year}-{d.month:02d}-{d.day:02d}",
+    "%Y/%m/%d": lambda d: f"{d.year}/{d.month:02d}/{d.day:02d}",
+}
+
+# ColumnMap defaults for entries missing from the json,
+# the optional entries the records check on every row default to None
+json_defaults = {
+    "accountType": "Bank",
+    "Separator": ",",
+    "StartLine": 1,
+    "QifTimeFormat": "%d/%m/%Y",
+    "CurrencySymbol": "",
+    "date": None,
+    "ActionMap": None,
+    "SecurityTypeMap": None,
+    "CalculationRules": None,
+    "InvertRules": None,
+    "Translations": None,
+}
+
+# json entries that control the conversion rather than name a record variable
+json_controls = set(json_defaults) | {"CsvTimeFormat", "CsvFile", "CsvFolder", "QifFile", "QifFolder"}
 
 class ColumnMap:
     def __init__(self, deff_):
@@ -53,19 +169,206 @@ class ColumnMap:
                     val = ord(val) - loweroffset
             self.__dict__[key] = val
 
-        # set some defaults
-        if self.__dict__.get("accountType", None) is None:
-            self.accountType = "Bank"
-        if self.__dict__.get("Separator", None) is None:
-            self.Separator = ","
-        if self.__dict__.get("StartLine", None) is None:
-            self.StartLine = 1
-        if self.__dict__.get("QifTimeFormat", None) is None:
-            self.QifTimeFormat = "%d/%m/%Y"
-        if self.__dict__.get("CurrencySymbol", None) is None:
-            self.CurrencySymbol = ""
+        # a misspelled record variable would just be ignored, so warn about lowercase
+        # names no record reads and capitalized names that look like one (e.g. "Date")
+        known = record_variables()
+        folded = {name.lower(): name for name in known}
+        rule_names = set()
+        if isinstance(csvdeff.get("CalculationRules", None), dict):
+            for attr, rule in csvdeff["CalculationRules"].items():
+                rule_names.add(attr)
+                rule_names.update(rule[0:3:2])
+        for key in csvdeff:
+            if key in known or key in json_controls or key in rule_names:
+                continue
+            match = difflib.get_close_matches(key.lower(), folded, n=1, cutoff=0.8)
+            if key[:1].islower() or match:
+                hint = ' (did you mean "' + folded[match[0]] + '"?)' if match else ""
+                print("warning: json entry", '"' + key + '"', "is not a QIF field the program knows, it is ignored" + hint)
+
+        # set some defaults (a null in the json also gets the default)
+        for key, default in json_defaults.items():
+            if self.__dict__.get(key, None) is None:
+                self.__dict__[key] = default
+
+        # look up the CalculationRules operations once rather than on every row
+        self.calculation_rules = []
+        if self.CalculationRules is not None:
+            for attr, rule in self.CalculationRules.items():
+                if len(rule) < 3:
+                    continue # bad definition in the json file
+                self.calculation_rules.append((attr, (rule[0], rule[1], rule[2], operations.get(rule[1], None))))
+
+        # compile the InvertRules conditions once rather than eval() the text on every row
+        self.invert_rules = []
+        if self.InvertRules is not None:
+            for attr, cond in self.InvertRules.items():
+                try:
+                    self.invert_rules.append((attr, compile_condition(cond, "<InvertRules " + attr + ">")))
+                except SyntaxError as e:
+                    print("Invalid InvertRules condition for", attr, ":", e)
+                    exit(1)
+
+        # same for the Translations, kept as (condition, new value) pairs per field
+        self.translations = []
+        if self.Translations is not None:
+            for attr, rule in self.Translations.items():
+                if len(rule) % 2 != 0:
+                    continue # bad definition in the json file
+                pairs = []
+                for x in range(0, len(rule), 2):
+                    try:
+                        pairs.append((compile_condition(rule[x], "<Translations " + attr + ">"), rule[x+1]))
+                    except SyntaxError as e:
+                        print("Invalid Translations condition for", attr, ":", e)
+                        exit(1)
+                self.translations.append((attr, pairs))
+
+        # number separators for the current locale, looked up once
+        # instead of by locale.atof() for every number in the CSV
+        conv = locale.localeconv()
+        self.thousands_sep = conv['thousands_sep']
+        self.decimal_point = conv['decimal_point']
+        # with nothing to substitute (e.g. the C locale) the float builtin does the same job
+        if self.thousands_sep == '' and self.decimal_point == '.':
+            self.atof = float
+        else:
+            self.atof = self.locale_atof
+
+        # work out once which CSV columns feed each record type
+        # so the records don't search the map on every row
+        self.bank_plan = self.build_plan(BankRecord.columns)
+        self.invst_plan = self.build_plan(InvstRecord.columns)
+        # and which QIF fields each can end up with, so the records
+        # only format those instead of checking every field in the layout
+        self.bank_layout = self.build_layout(BankRecord, self.bank_plan)
+        self.invst_layout = self.build_layout(InvstRecord, self.invst_plan)
+        self.bank_formatter = build_formatter(self.bank_layout)
+        self.invst_formatter = build_formatter(self.invst_layout)
+        # SecurityRecord picks its columns conditionally, so it gets the
+        # column indices (None when not mapped) rather than a plan
+        self.security_cols = SecurityColumns(*(self.__dict__.get(attr, None) for attr in SecurityColumns._fields))
+        # a security only depends on these columns, this pulls them out of a row together
+        key_cols = [col for col in self.security_cols if col is not None]
+        self.security_key = operator.itemgetter(*key_cols) if key_cols else None
+        # CSV files repeat the same dates over and over, so remember the
+        # recent conversions (bounded, a file spanning decades still fits)
+        self.convert_date = functools.lru_cache(maxsize=8192)(self.convert_date)
+        # common date formats have a quicker way than strptime/strftime
+        self.fast_parse_date = fast_date_parsers.get(self.__dict__.get("CsvTimeFormat", None), None)
+        self.fast_format_date = fast_date_formatters.get(self.QifTimeFormat, None)
+
+    def build_plan(self, columns):
+        """
+        Picks out the record variables this definition file maps to a CSV column.
+
+        Args:
+            columns (tuple): (variable name, converter name) pairs from a record class.
+
+        Returns:
+            list: (variable name, column index, converter) tuples.
+                  The converter is None when the column text is used as-is.
+        """
+        plan = []
+        for attr, converter in columns:
+            col = self.__dict__.get(attr, None)
+            if col is not None:
+                plan.append((attr, col, getattr(self, converter) if converter else None))
+        return plan
+
+    def build_layout(self, record, plan):
+        """
+        Trims a record class layout down to the fields this definition file
+        can fill: the date, the mapped columns, and the rule results.
+
+        Args:
+            record (class): BankRecord or InvstRecord.
+            plan (list): The plan built for the record by build_plan().
+
+        Returns:
+            tuple: The (field, id) pairs from the record layout that can have a value.
+        """
+        filled = {attr for attr, col, convert in plan}
+        if self.date is not None:
+            filled.add('date')
+        filled.update(attr for attr, rule in self.calculation_rules)
+        if self.Translations is not None:
+            filled.update(self.Translations)
+        return tuple((attr, id_char) for attr, id_char in record.layout if attr in filled)
+
+    def convert_date(self, text):
+        """
+        Converts a CSV date to the QIF date format.
+        Wrapped in an lru_cache by __init__ so each distinct date is only parsed once.
+
+        Args:
+            text (string): Date from the CSV, in the CsvTimeFormat.
+
+        Returns:
+            tuple: The parsed datetime and the date formatted in the QifTimeFormat.
+        """
+        date_in = self.fast_parse_date(text) if self.fast_parse_date else None
+        if date_in is None:
+            date_in = datetime.strptime(text, self.CsvTimeFormat)
+        # (years before 1000 are left to strftime, its padding varies by platform)
+        if self.fast_format_date and date_in.year >= 1000:
+            date = self.fast_format_date(date_in)
+        else:
+            date = datetime.strftime(date_in, self.QifTimeFormat)
+        return (date_in, date)
+
+    def locale_atof(self, text):
+        """
+        Same as locale.atof() but uses the separators saved when the map was built.
+        Used as self.atof() when the locale has separators to substitute.
+
+        Args:
+            text (string): Number formatted for the current locale.
+
+        Returns:
+            float: The converted number.
+        """
+        if self.thousands_sep:
+            text = text.replace(self.thousands_sep, '')
+        if self.decimal_point != '.':
+            text = text.replace(self.decimal_point, '.')
+        return float(text)
+
+    # converters named in the record column plans, each takes the (non-empty) column text
+    def to_number(self, text):
+        return self.atof(text.strip(self.CurrencySymbol))
+
+    def to_abs_number(self, text):
+        return abs(self.to_number(text))
+
+    def to_first_letter(self, text):
+        return text[:1]
+
+    def to_quantity(self, text):
+        # parse once, and fractional quantities (e.g. "0.5") are fine
+        quantity = self.atof(text)
+        return quantity if quantity > 0 else None
+
+    def to_commission(self, text):
+        # the commission column may hold text that isn't a number, that's no commission
+        text = text.strip(self.CurrencySymbol)
+        # check for nan/infinity etc.
+        if text.isalpha():
+            return None
+        try:
+            return self.atof(text)
+        except ValueError:
+            return None
+
+    def to_int(self, text):
+        return int(text)
 
 class AccountRecord:
+    fields = ('account', 'accountType', 'taxRate', 'description', 'limit', 'balance')
+    ids =    ('N',       'T',           'R',       'D',           'L',     '$')
+    # (field, id) pairs in output order, paired up once for get_formatted_string
+    layout = tuple(zip(fields, ids))
+
     def __init__(self, map):
         """
         Parses the passed JSON ColumnMap into class variables which
@@ -74,9 +377,6 @@ class AccountRecord:
         Args:
             map (ColumnMap): Contains the JSON to CSV data mapping.
         """
-        self.fields = ['account', 'accountType', 'taxRate', 'description', 'limit', 'balance']
-        self.ids =    ['N',       'T',           'R',       'D',           'L',     '$']
-
         self.account = getattr(map,"account",None)
         self.accountType = getattr(map,"accountType", None)
         self.taxRate = locale.atof(getattr(map,"taxRate")) if map \
@@ -87,17 +387,38 @@ class AccountRecord:
         self.balance = None # placeholder for balance collected from the csv
 
     def get_formatted_string(self):
+        parts = []
         if getattr(self, "account", None) is not None:
-            result = "!Account\n"
-        else:
-            result = ""
-        for attr, id_char in zip(self.fields, self.ids):
-            value = getattr(self, attr)
+            parts.append("!Account\n")
+        values = self.__dict__
+        for attr, id_char in self.layout:
+            value = values.get(attr)
             if value is not None:
-                result += f"{id_char}{value}\n"
-        return result + "^\n"
+                parts.append(f"{id_char}{value}\n")
+        parts.append("^\n")
+        return "".join(parts)
 
 class BankRecord:
+    fields = ('date', 'amountT', 'amountU', 'cleared', 'checkNum', 'payee', 'memo', 'address', 'category', 'categoryInSplit', 'memoInSplit', 'amountOfSplit', 'percentageOfSplit', "reimbursable")
+    ids =    ('D',    'T',       'U',       'C',       'N',        'P',     'M',    'A',       'L',        'S',               'E',           '$',              '%',                'F')
+    layout = tuple(zip(fields, ids))
+
+    # record variables read straight from a CSV column and the ColumnMap
+    # converter applied to the column text (None keeps the text as-is)
+    columns = (('amountT', 'to_number'), ('amountU', 'to_number'),
+               # keeping only the first letter of the "cleared" column, may not work for all files
+               # (i.e. works if the column says "Cleared", "Reconciled", or blank/missing)
+               ('cleared', 'to_first_letter'),
+               ('checkNum', None), ('payee', None), ('memo', None), ('address', None),
+               ('category', None), ('categoryInSplit', None), ('memoInSplit', None),
+               ('amountOfSplit', 'to_number'), ('percentageOfSplit', 'to_number'),
+               ('reimbursable', None),
+               # we can also collect the balance to support the AccountRecord
+               ('balance', 'to_number'),
+               # and a couple of non-QIF intermediate fields for credit card calculation
+               ('Credit', 'to_number'), ('Debit', 'to_number'))
+    empty_columns = dict.fromkeys(attr for attr, _ in columns)
+
     def __init__(self, row, map):
         """
         Parses the passed CSV row and JSON ColumnMap into class variables which
@@ -107,108 +428,34 @@ class BankRecord:
             row (csv.reader row): Incomming CSV data.
             map (ColumnMap): Contains the JSON to CSV data mapping.
         """
-        self.fields = ['date', 'amountT', 'amountU', 'cleared', 'checkNum', 'payee', 'memo', 'address', 'category', 'categoryInSplit', 'memoInSplit', 'amountOfSplit', 'percentageOfSplit', "reimbursable"]
-        self.ids =    ['D',    'T',       'U',       'C',       'N',        'P',     'M',    'A',       'L',        'S',               'E',           '$',              '%',                'F']
-
-        self.date_in = datetime.strptime(row[map.date], map.CsvTimeFormat) \
-                        if row and map \
-                        and getattr(map,"date",None) is not None \
-                        else None
-        self.date = datetime.strftime(self.date_in, map.QifTimeFormat) \
-                        if self.date_in is not None \
-                        else None
-        self.amountT = locale.atof(row[map.amountT].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amountT",None) is not None \
-                        and len(row[map.amountT]) > 0 \
-                        else None
-        self.amountU = locale.atof(row[map.amountU].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amountU",None) is not None \
-                        and len(row[map.amountU]) > 0 \
-                        else None
-        # keeping only the first letter of the "cleared" column, may not work for all files
-        # (i.e. works if the column says "Cleared", "Reconciled", or blank/missing)
-        self.cleared = row[map.cleared][:1] if row and map \
-                        and getattr(map,"cleared",None) is not None \
-                        and len(row[map.cleared]) > 0 \
-                        else None
-        self.checkNum = row[map.checkNum] if row and map \
-                        and getattr(map,"checkNum",None) is not None \
-                        and len(row[map.checkNum]) > 0 \
-                        else None
-        self.payee = row[map.payee] if row and map \
-                        and getattr(map,"payee",None) is not None \
-                        and len(row[map.payee]) > 0 \
-                        else None
-        self.memo = row[map.memo] if row and map \
-                        and getattr(map,"memo",None) is not None \
-                        and len(row[map.memo]) > 0 \
-                        else None
-        self.address = row[map.address] if row and map \
-                        and getattr(map,"address",None) is not None \
-                        and len(row[map.address]) > 0 \
-                        else None
-        self.category = row[map.category] if row and map \
-                        and getattr(map,"category",None) is not None \
-                        and len(row[map.category]) > 0 \
-                        else None
-        self.categoryInSplit = row[map.categoryInSplit] if row and map \
-                        and getattr(map,"categoryInSplit",None) is not None \
-                        and len(row[map.categoryInSplit]) > 0 \
-                        else None
-        self.memoInSplit = row[map.memoInSplit] if row and map \
-                        and getattr(map,"memoInSplit",None) is not None \
-                        and len(row[map.memoInSplit]) > 0 \
-                        else None
-        self.amountOfSplit = locale.atof(row[map.amountOfSplit].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amountOfSplit",None) is not None \
-                        and len(row[map.amountOfSplit]) > 0 \
-                        else None
-        self.percentageOfSplit = locale.atof(row[map.percentageOfSplit].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"percentageOfSplit",None) is not None \
-                        and len(row[map.percentageOfSplit]) > 0 \
-                        else None
-        self.reimbursable = row[map.reimbursable] if row and map \
-                        and getattr(map,"reimbursable",None) is not None \
-                        and len(row[map.reimbursable]) > 0 \
-                        else None
+        # start with every variable empty, then fill in the mapped columns
+        self.__dict__.update(self.empty_columns)
 
-        # we can also collect the balance to support the AccountRecord
-        self.balance = locale.atof(row[map.balance].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"balance",None) is not None \
-                        and len(row[map.balance]) > 0 \
-                        else None
-        # and create a couple of non-QIF intermediate fields for credit card calculation
-        self.Credit = locale.atof(row[map.Credit].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"Credit",None) is not None \
-                        and len(row[map.Credit]) > 0 \
-                        else None
-        self.Debit = locale.atof(row[map.Debit].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"Debit",None) is not None \
-                        and len(row[map.Debit]) > 0 \
-                        else None
+        # formats only the fields this map can fill
+        self.formatter = map.bank_formatter
 
+        self.date_in, self.date = map.convert_date(row[map.date]) \
+                        if row and map.date is not None \
+                        else (None, None)
+        if row:
+            for attr, col, convert in map.bank_plan:
+                text = row[col]
+                if text:
+                    self.__dict__[attr] = convert(text) if convert else text
 
         # any caluculated fields?
-        valmap = getattr(map, "CalculationRules", None)
-        if valmap is not None:
-            for attr in valmap:
-                # we have a calculation
-                expr = valmap[attr]
-                caluculate_field(self, attr, expr)
+        for attr, rule in map.calculation_rules:
+            caluculate_field(self, attr, rule)
 
         # change the sign on anything?
-        valmap = getattr(map, "InvertRules", None)
-        if valmap is not None:
-            # we have invert rules
-            # do we have the attribute(s) it wants to invert?
-            for attr in valmap:
-                if getattr(self, attr, None) is not None:
-                    # we have a value for the attribute to be inverted
-                    # get the condition for inverting
-                    cond = valmap[attr]
-                    if eval(cond):
-                        # conditions are met
-                        invert_field(self, attr)
+        # do we have the attribute(s) the invert rules want to invert?
+        for attr, cond in map.invert_rules:
+            if getattr(self, attr, None) is not None:
+                # we have a value for the attribute to be inverted
+                # test the (compiled) condition for inverting
+                if cond(self):
+                    # conditions are met
+                    invert_field(self, attr)
 
     def get_formatted_string(self):
         """
@@ -217,14 +464,23 @@ class BankRecord:
         Returns:
             string: The !Type:Bank record (not including the !Type:Bank line).
         """
-        result = ""
-        for attr, id_char in zip(self.fields, self.ids):
-            value = getattr(self, attr)
-            if value is not None:
-                result += f"{id_char}{value}\n"
-        return result + "^\n"
+        return self.formatter(self.__dict__)
 
 class InvstRecord:
+    fields = ('date', 'action', 'security', 'price', 'quantity', 'cleared', 'transfer_text', 'memo', 'commission', 'category', 'amountT', 'amountU', 'amount_transferred')
+    ids =    ('D',    'N',      'Y',        'I',     'Q',        'C',       'P',             'M',    'O',          'L',        'T',       'U',       '$')
+    layout = tuple(zip(fields, ids))
+
+    # record variables read straight from a CSV column and the ColumnMap
+    # converter applied to the column text (None keeps the text as-is)
+    columns = (('security', None), ('memo', None), ('action', None),
+               ('price', 'to_abs_number'), ('quantity', 'to_quantity'), ('cleared', None),
+               ('transfer_text', None), ('commission', 'to_commission'), ('category', None),
+               ('amountT', 'to_number'), ('amountU', 'to_number'), ('amount_transferred', 'to_number'),
+               # extra columns that are not part of a QIF record but we want to capture
+               ('Fees', 'to_number'), ('Multiplier', 'to_int'))
+    empty_columns = dict.fromkeys(attr for attr, _ in columns)
+
     def __init__(self, row, map):
         """
         Parses the passed CSV row and JSON ColumnMap into class variables which
@@ -234,127 +490,58 @@ class InvstRecord:
             row (csv.reader row): Incomming CSV data.
             map (ColumnMap): Contains the JSON to CSV data mapping.
         """
-        self.fields = ['date', 'action', 'security', 'price', 'quantity', 'cleared', 'transfer_text', 'memo', 'commission', 'category', 'amountT', 'amountU', 'amount_transferred']
-        self.ids =    ['D',    'N',      'Y',        'I',     'Q',        'C',       'P',             'M',    'O',          'L',        'T',       'U',       '$']
+        # start with every variable empty, then fill in the mapped columns
+        self.__dict__.update(self.empty_columns)
+        self.Multiplier = 1
+
+        # generated for the fields the json can fill
+        self.formatter = map.invst_formatter
+
+        self.date_in, self.date = map.convert_date(row[map.date]) \
+                        if row and map.date is not None \
+                        else (None, None)
+        if row:
+            for attr, col, convert in map.invst_plan:
+                text = row[col]
+                if text:
+                    self.__dict__[attr] = convert(text) if convert else text
 
-        self.date_in = datetime.strptime(row[map.date], map.CsvTimeFormat) \
-                        if row and map \
-                        and getattr(map,"date",None) is not None \
-                        else None
-        self.date = datetime.strftime(self.date_in, map.QifTimeFormat) \
-                        if self.date_in is not None \
-                        else None
-        
-        self.security = row[map.security] if row and map \
-                        and getattr(map,"security",None) is not None \
-                        and len(row[map.security]) > 0 \
-                        else None
-        self.memo = row[map.memo] if row and map \
-                        and getattr(map,"memo",None) is not None \
-                        and len(row[map.memo]) > 0 \
-                        else None
-        self.action = row[map.action] if row and map \
-                        and getattr(map,"action",None) is not None \
-                        and len(row[map.action]) > 0 \
-                        else None
         # translate action to QIF terms?
-        if self.action is not None:
-            self.valmap = getattr(map,"ActionMap",None)
-            if self.valmap is not None:
-                if self.action in self.valmap:
-                    if self.valmap[self.action] == 'prompt':
-                        print (self.date, self.action, self.memo)
-                        self.action = input ("Enter a QIF ID 'N' Action for the record above: ")
-                    else:
-                        self.action = self.valmap[self.action]
-
-        self.price = abs(locale.atof(row[map.price].strip(map.CurrencySymbol))) if row and map \
-                        and getattr(map,"price",None) is not None \
-                        and len(row[map.price]) > 0 \
-                        else None
-        self.quantity = locale.atof(row[map.quantity]) \
-                        if row and map and getattr(map,"quantity",None) is not None \
-                        and len(row[map.quantity]) > 0 \
-                        and int(row[map.quantity]) > 0 \
-                        else None
-        self.cleared = row[map.cleard] if row and map \
-                        and getattr(map,"cleared",None) is not None \
-                        and len(row[map.cleared]) > 0 \
-                        else None
-        self.transfer_text = row[map.transfer_text] if row and map \
-                        and getattr(map,"transfer_text",None) is not None \
-                        and len(row[map.transfer_text]) > 0 \
-                        else None
-        self.commission = locale.atof(row[map.commission].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"commission",None) is not None \
-                        and len(row[map.commission]) > 0 \
-                        and is_float(row[map.commission].strip(map.CurrencySymbol)) \
-                        else None
-        self.category = row[map.category] if row and map and \
-                        getattr(map,"category",None) is not None \
-                        and len(row[map.category]) > 0 \
-                        else None
-        self.amountT = locale.atof(row[map.amountT].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amountT",None) is not None \
-                        and len(row[map.amountT]) > 0 \
-                        else None
-        self.amountU = locale.atof(row[map.amountU].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amountU",None) is not None \
-                        and len(row[map.amountU]) > 0 \
-                        else None
-        self.amount_transferred = locale.atof(row[map.amount_transferred].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"amount_transferred",None) is not None \
-                        and len(row[map.amount_transferred]) > 0 \
-                        else None
-
-        # extra columns that are not part of a QIF record but we want to capture
-        self.Fees = locale.atof(row[map.Fees].strip(map.CurrencySymbol)) if row and map \
-                        and getattr(map,"Fees",None) is not None \
-                        and len(row[map.Fees]) > 0 \
-                        else None
-        self.Multiplier = int(row[map.Multiplier]) if row and map \
-                        and getattr(map,"Multiplier",None) is not None \
-                        and len(row[map.Multiplier]) > 0 \
-                        else 1
+        valmap = map.ActionMap
+        if self.action is not None and valmap is not None:
+            # (an action that isn't in the map stays as it is)
+            qif_action = valmap.get(self.action, self.action)
+            # only a mapped 'prompt' asks, not a CSV action that is itself "prompt"
+            if qif_action == 'prompt' and self.action in valmap:
+                print (self.date, self.action, self.memo)
+                self.action = input ("Enter a QIF ID 'N' Action for the record above: ")
+            else:
+                self.action = qif_action
 
         # any caluculated fields?
-        valmap = getattr(map, "CalculationRules", None)
-        if valmap is not None:
-            for attr in valmap:
-                if getattr(self, attr, None) is not None:
-                    # we have a calculation
-                    expr = valmap[attr]
-                    caluculate_field(self, attr, expr)
+        for attr, rule in map.calculation_rules:
+            if getattr(self, attr, None) is not None:
+                # we have a calculation
+                caluculate_field(self, attr, rule)
 
         # any translations?
-        valmap = getattr(map, "Translations", None)
-        if valmap is not None:
-            # we have translation rules
-            for attr in valmap:
-                # do we have the field it wants to translate?
-                if attr in self.fields:
-                    entries = len(valmap[attr])
-                    if entries % 2 == 0:
-                        for x in range(0, entries, 2):
-                            cond = valmap[attr][x]
-                            newval = valmap[attr][x+1]
-                            if eval(cond):
-                                # condition is true
-                                self.__dict__[attr] = newval
+        for attr, rules in map.translations:
+            # do we have the field it wants to translate?
+            if attr in self.fields:
+                for cond, newval in rules:
+                    if cond(self):
+                        # condition is true
+                        setattr(self, attr, newval)
 
         # change the sign on anything?
-        valmap = getattr(map, "InvertRules", None)
-        if valmap is not None:
-            # we have invert rules
-            # do we have the attribute(s) it wants to invert?
-            for attr in valmap:
-                if getattr(self, attr, None) is not None:
-                    # we have a value for the attribute to be inverted
-                    # get the condition for inverting
-                    cond = valmap[attr]
-                    if eval(cond):
-                        # conditions are met
-                        invert_field(self, attr)
+        # do we have the attribute(s) the invert rules want to invert?
+        for attr, cond in map.invert_rules:
+            if getattr(self, attr, None) is not None:
+                # we have a value for the attribute to be inverted
+                # test the (compiled) condition for inverting
+                if cond(self):
+                    # conditions are met
+                    invert_field(self, attr)
         
     def get_formatted_string(self):
         """
@@ -363,14 +550,13 @@ class InvstRecord:
         Returns:
             string: The !Type:Invst record (not including the !Type:Invst line).
         """
-        result = ""
-        for attr, id_char in zip(self.fields, self.ids):
-            value = getattr(self, attr)
-            if value is not None:
-                result += f"{id_char}{value}\n"
-        return result + "^\n"
+        return self.formatter(self.__dict__)
 
 class SecurityRecord:
+    fields = ('security', 'symbol', 'type', 'goal')
+    ids =    ('N',        'S',      'T',    'G')
+    layout = tuple(zip(fields, ids))
+
     def __init__(self, row, map):
         """
         Parses the passed CSV row and JSON ColumnMap into class variables which
@@ -380,53 +566,28 @@ class SecurityRecord:
             row (csv.reader row): Incomming CSV data.
             map (ColumnMap): Contains the JSON to CSV data mapping.
         """
-        self.fields = ['security', 'symbol', 'type', 'goal']
-        self.ids =    ['N',        'S',      'T',    'G']
-
-        self.typeTest = row[map.type] if row and map \
-                        and getattr(map,"type",None) \
-                        and len(row[map.type]) > 0 \
-                        else None
+        cols = map.security_cols
+        self.typeTest = column_text(row, cols.type) if row else None
         # translate security type to QIF terms?
-        if self.typeTest is not None:
-            self.valmap = getattr(map,"SecurityTypeMap",None)
-            if self.valmap is not None:
-                if self.typeTest in self.valmap:
-                    self.typeTest = self.valmap[self.typeTest]
+        valmap = map.SecurityTypeMap
+        if self.typeTest is not None and valmap is not None:
+            self.typeTest = valmap.get(self.typeTest, self.typeTest)
 
         # only fill out the record for 'Stock' or 'Option' types
         if self.typeTest is not None and (self.typeTest == 'Stock' or self.typeTest == 'Option'):
             self.type = self.typeTest
-            self.symbol = row[map.symbol] if row and map \
-                        and getattr(map,"symbol",None) is not None \
-                        and len(row[map.symbol]) > 0 \
-                        else None
-            self.security = row[map.security] if row and map \
-                        and getattr(map,"security",None) \
-                        and self.symbol is not None \
-                        and len(row[map.security]) > 0 \
-                        else None
-            self.goal = row[map.goal] if row and map \
-                        and getattr(map,"goal",None) \
-                        and self.symbol is not None \
-                        and len(row[map.goal]) > 0 \
-                        else None
+            self.symbol = column_text(row, cols.symbol)
+            self.security = column_text(row, cols.security) if self.symbol is not None else None
+            self.goal = column_text(row, cols.goal) if self.symbol is not None else None
 
             # any translations?
-            valmap = getattr(map, "Translations", None)
-            if valmap is not None:
-                # we have translation rules
-                for attr in valmap:
-                    # do we have the field it wants to translate?
-                    if attr in self.fields:
-                        entries = len(valmap[attr])
-                        if entries % 2 == 0:
-                            for x in range(0, entries, 2):
-                                cond = valmap[attr][x]
-                                newval = valmap[attr][x+1]
-                                if eval(cond):
-                                    # condition is true
-                                    self.__dict__[attr] = newval
+            for attr, rules in map.translations:
+                # do we have the field it wants to translate?
+                if attr in self.fields:
+                    for cond, newval in rules:
+                        if cond(self):
+                            # condition is true
+                            setattr(self, attr, newval)
 
     def get_formatted_string(self):
         """
@@ -435,99 +596,276 @@ class SecurityRecord:
         Returns:
             string: The !Type:Security record (not including the !Type:Security line).
         """
-        result = ""
-        for attr, id_char in zip(self.fields, self.ids):
-            value = getattr(self, attr)
+        parts = []
+        values = self.__dict__
+        for attr, id_char in self.layout:
+            value = values.get(attr)
             if value is not None:
-                result += f"{id_char}{value}\n"
-        return result + "^\n" if len(result) > 0 else None
+                parts.append(f"{id_char}{value}\n")
+        if not parts:
+            return None
+        parts.append("^\n")
+        return "".join(parts)
+
+def build_formatter(layout):
+    """
+    Generates the function that formats a QIF record for a trimmed record layout.
+    The generated code has a few straight lines per field instead of a loop
+    over the layout, since the fields are known once the json is loaded.
+
+    Args:
+        layout (tuple): (field, id) pairs in QIF output order.
+
+    Returns:
+        function: Takes the record's variables (the record __dict__)
+                  and returns the QIF record text ending with the ^ line.
+    """
+    lines = ["def format_record(values):",
+             "    parts = []",
+             "    get = values.get"]
+    for attr, id_char in layout:
+        # the names and ids come from the record classes, not the json
+        lines.append(f"    value = get({attr!r})")
+        lines.append("    if value is not None:")
+        lines.append(f'        parts.append(f"{id_char}{{value}}\\n")')
+    lines.append('    parts.append("^\\n")')
+    lines.append('    return "".join(parts)')
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["format_record"]
+
+def record_variables():
+    """
+    Lists the variable names the record classes read from the ColumnMap.
+
+    Returns:
+        set: The names, e.g. 'date', 'amountT', 'symbol'.
+    """
+    names = set(AccountRecord.fields) | set(BankRecord.fields) | set(InvstRecord.fields)
+    names.update(attr for attr, converter in BankRecord.columns + InvstRecord.columns)
+    names.update(SecurityColumns._fields)
+    return names
+
+def column_text(row, col):
+    """
+    Gets the text in a CSV column.
+
+    Args:
+        row (csv.reader row): Incomming CSV data.
+        col (int): Column index, None if the json doesn't map the column.
+
+    Returns:
+        string: The column text, None if the column is not mapped or is empty.
+    """
+    if col is None:
+        return None
+    text = row[col]
+    return text if text else None
+
+def split_rows(inf_, delimiter):
+    """
+    Reads CSV rows like csv.reader, but splits lines without a quote character
+    on the delimiter directly, which gives the same row quicker.
+    A line with a quote goes to a csv.reader (which also reads the
+    rest of a quoted field that continues on the following lines).
+
+    Args:
+        inf_ (file): The CSV input file opened for reading with newline=''.
+        delimiter (string): The column separator.
 
-def readCsv(inf_, outf_, colmap):
+    Yields:
+        list: The column text of each row, [] for a blank line.
+    """
+    lines = iter(inf_)
+    pending = [] # the quoted line the csv reader reads next
+
+    def quoted_lines():
+        while True:
+            if pending:
+                yield pending.pop()
+            else:
+                # continuation of a quoted field
+                line = next(lines, None)
+                if line is None:
+                    return
+                yield line
+
+    quoted = csv.reader(quoted_lines(), delimiter=delimiter)
+    for line in lines:
+        if '"' in line:
+            pending.append(line)
+            yield next(quoted)
+        else:
+            line = line.rstrip('\r\n')
+            yield line.split(delimiter) if line else []
+
+# transactions held in memory before readCsv writes them out
+default_chunk_size = 10000
+
+def readCsv(inf_, outf_, colmap, chunk_size=default_chunk_size):
     """
     Reads the CSV file and writes the QIF file using a column map.
+    The CSV is only read once. The account balance and the securities
+    are collected on the same pass as the transactions and written
+    ahead of them once the pass is done. The transactions are written out
+    in batches as they are read so the whole QIF file is never held in memory.
+    When there is no balance or securities to collect, the batches go
+    straight to the QIF file, otherwise to a temporary file that is
+    copied in behind the account and securities.
+    A transaction error leaves all of the transactions out of the QIF file,
+    a security error only leaves out the securities.
 
     Args:
         inf_ (file):  The CSV input file opened for reading.
-        outf_ (file): The QIF file opened for writing.
+        outf_ (file): The QIF file opened for writing in binary.
         colmap (ColumnMap) : The results of parsing the JSON defnition file.
+        chunk_size (int): Number of transactions held before a batch is written.
 
     Returns:
         None
     """
 
-    csvIn = csv.reader(inf_, delimiter=colmap.Separator)  #create csv object using the given separator
+    # skip to the start line before the csv reader sees the file,
+    # so the skipped lines are never tokenized
+    for x in range(1, colmap.StartLine):
+        inf_.readline()
+    # files that quote their fields go straight to the csv reader,
+    # others can mostly be split on the separator
+    start = inf_.tell()
+    sample = inf_.read(1 << 16)
+    inf_.seek(start)
+    if '"' in sample:
+        csvIn = csv.reader(inf_, delimiter=colmap.Separator)  #create csv object using the given separator
+    else:
+        csvIn = split_rows(inf_, colmap.Separator)
 
     # fill out the account record if the json spec has an account name
+    acct_rec = None
+    track_balance = False
     if colmap.account and colmap.accountType is not None:
         acct_rec = AccountRecord(colmap)
-        if acct_rec.accountType != 'Invst' \
-            and getattr(colmap, "balance", None) is not None:
-            # we have a bank balance column
-            # make a pass through the csv and collect the balance with the latest date
-            for x in range(1, colmap.StartLine): #skip to start line
-                next(csvIn,None)  #skip
-            latestDate = datetime.min # little date, everything will be newer than this
-            try:
-                for row in csvIn:
-                    rec = BankRecord(row, colmap)
-                    if getattr(rec, "date", None) is not None \
-                        and getattr(rec, "balance", None) is not None:
-                        # update the balance?
-                        rec_time = datetime.strptime(rec.date, colmap.QifTimeFormat)
-                        if rec_time > latestDate:
-                            acct_rec.balance = rec.balance
-                            latestDate = rec_time
-            except:
-                print("CSV file error (AccountRecord). CSV file may not conform to the json definition file:")
-                print("  ", row)
-            inf_.seek(0)
-        outf_.write(acct_rec.get_formatted_string())
-
-    # if investment, make a pass thru to collect securities
-    if colmap.accountType == "Invst":
-        sec_rec = StringIO()
-        sec_list = [] # only need each security once, track what we've seen
-        for x in range(1, colmap.StartLine): #skip to start line
-            next(csvIn,None)  #skip
-        sec_len = 0
-        try:
-            for row in csvIn:
-                rec = SecurityRecord(row, colmap)
-                if getattr(rec, "type", None) is not None:
-                    if rec.symbol not in sec_list:
-                        sec_list.append(rec.symbol)
-                        if sec_len == 0:
-                            sec_rec.write("!Type:Security\n")
-                        sec_len += sec_rec.write(rec.get_formatted_string())
-            if sec_len > 0:
-                outf_.write(sec_rec.getvalue())
-            sec_rec.close()
-        except:
-            print("CSV file error (SecurityRecord). CSV file may not conform to the json definition file:")
-            print("  ", row)
-        inf_.seek(0)
-
-
-    for x in range(1, colmap.StartLine): #skip to start line
-        next(csvIn,None)  #skip
-
-    transact_rec = StringIO()
-    transact_len = 0
+        # with a bank balance column, collect the balance with the latest date
+        track_balance = acct_rec.accountType != 'Invst' \
+            and getattr(colmap, "balance", None) is not None
+    latestDate = None
+
+    # if investment, collect the securities too
+    collect_securities = colmap.accountType == "Invst"
+    sec_seen = set() # only need each security once, track what we've seen
+    sec_parts = []
+    # security column values already turned into a SecurityRecord,
+    # any other row with the same values makes the same record
+    sec_rows_seen = set()
+
+    # nothing to collect means the account record is already complete
+    # and the transactions can be written as they are read
+    stream = not track_balance and not collect_securities
+    if stream and acct_rec is not None:
+        outf_.write(encode_qif(acct_rec.get_formatted_string()))
+    # where the transactions start, so a CSV error can take them back out
+    transact_start = outf_.tell()
+    # where the transaction batches go, the temporary file
+    # is only made if a file has more than one batch
+    batches = outf_ if stream else None
+
+    Record = InvstRecord if colmap.accountType == "Invst" else BankRecord
+    transact_header = "!Type:" + colmap.accountType + "\n"
+    transact_parts = []
     try:
         for row in csvIn:
-            if colmap.accountType == "Invst":
-                rec = InvstRecord(row, colmap)
-            else:
-                rec = BankRecord(row, colmap)
-            if transact_len == 0:
-                transact_rec.write("!Type:" + colmap.accountType + "\n")
-            transact_len += transact_rec.write(rec.get_formatted_string())
-        outf_.write(transact_rec.getvalue())
-        transact_rec.close()
+            if collect_securities:
+                try:
+                    sec_key = colmap.security_key(row) if colmap.security_key else None
+                except IndexError:
+                    sec_key = None # short row, leave it to the SecurityRecord
+                try:
+                    if sec_key is None or sec_key not in sec_rows_seen:
+                        sec_rows_seen.add(sec_key)
+                        sec = SecurityRecord(row, colmap)
+                        if getattr(sec, "type", None) is not None \
+                            and sec.symbol not in sec_seen:
+                            sec_seen.add(sec.symbol)
+                            sec_parts.append(sec.get_formatted_string())
+                except:
+                    # a bad security only loses the security section,
+                    # the transactions still go out
+                    print("CSV file error (SecurityRecord). CSV file may not conform to the json definition file:")
+                    print("  ", row)
+                    collect_securities = False
+                    sec_parts.clear()
+            rec = Record(row, colmap)
+            if track_balance \
+                and rec.date_in is not None \
+                and rec.balance is not None:
+                # update the balance?
+                if latestDate is None or rec.date_in > latestDate:
+                    acct_rec.balance = rec.balance
+                    latestDate = rec.date_in
+            transact_parts.append(rec.get_formatted_string())
+            if len(transact_parts) >= chunk_size:
+                if batches is None:
+                    batches = tempfile.TemporaryFile()
+                batches.write(encode_qif(transact_header + "".join(transact_parts)))
+                transact_header = "" # only goes in front of the first batch
+                transact_parts.clear()
     except:
         print("CSV file error (data record). CSV file may not conform to the json definition file:")
         print("  ", row)
-    
+        print("   No transactions were written to the QIF file.")
+        # like a file that was not streamed, keep just the account and securities,
+        # a QIF with only some of the transactions would import without complaint
+        if batches is outf_:
+            outf_.seek(transact_start)
+            outf_.truncate()
+        elif batches is not None:
+            batches.close()
+        batches = None
+        transact_parts.clear()
+
+    # QIF order is account, securities, then transactions
+    qif = bytearray()
+    if acct_rec is not None and not stream:
+        qif += encode_qif(acct_rec.get_formatted_string())
+    if sec_parts:
+        qif += encode_qif("!Type:Security\n")
+        qif += encode_qif("".join(sec_parts))
+    if batches is not None and batches is not outf_:
+        # the transactions written ahead go in behind the account and securities
+        outf_.write(qif)
+        qif = bytearray()
+        batches.seek(0)
+        for block in iter(lambda: batches.read(1<<20), b""):
+            outf_.write(block)
+        batches.close()
+    if transact_parts:
+        qif += encode_qif(transact_header + "".join(transact_parts))
+    outf_.write(qif)
+
+def encode_qif(text):
+    """
+    Encodes QIF text for the binary QIF file the same way a
+    text mode file would (platform line ends, preferred encoding).
+
+    Args:
+        text (string): QIF records using '\\n' line ends.
+
+    Returns:
+        bytes: The encoded text.
+    """
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode(locale.getpreferredencoding(False))
+
+# how to change the sign of a number kept as text, keyed by its first character
+# (anything other than a sign just gets a '-' added)
+sign_flips = {
+    '-': lambda text: text[1:],        # remove the -
+    '+': lambda text: '-' + text[1:],  # remove the +, add a -
+}
+
+def add_minus(text):
+    return '-' + text
+
 def invert_field(recordClass, attr):
     """
     Change the sign of the class variable 'attr' in the class 'recordClass'.
@@ -536,18 +874,36 @@ def invert_field(recordClass, attr):
         self (class): Class containing the variable 'attr'.
         attr (string): Name of the class variable to invert.
     """
-    if isinstance(recordClass.__dict__[attr], str):
+    value = getattr(recordClass, attr)
+    if type(value) is str:
         # just change the sign on the string
-        oldval = recordClass.__dict__[attr]
-        if oldval.startswith('-'):
-            recordClass.__dict__[attr] = oldval[1:]        # remove the -
-        elif oldval.startswith('+'):
-            recordClass.__dict__[attr] = '-' + oldval[1:]  # remove the +, add a -
-        else:
-            recordClass.__dict__[attr] = '-' + oldval      # add a -
+        setattr(recordClass, attr, sign_flips.get(value[:1], add_minus)(value))
     else:
         # it's a number of some sort
-        recordClass.__dict__[attr] = recordClass.__dict__[attr] * -1
+        setattr(recordClass, attr, -value)
+
+# CalculationRules operations
+operations = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+def compile_condition(cond, name):
+    """
+    Compiles an InvertRules or Translations condition once, when the map is loaded.
+    The condition becomes the body of a function of 'self', so testing it on a row
+    is a plain function call instead of an eval() with a new locals dictionary.
+
+    Args:
+        cond (string): The condition from the json, e.g. "self.action=='Buy'".
+        name (string): Name for the compiled code, shows up in error messages.
+
+    Returns:
+        function: Takes a record and returns the condition's result for that record.
+
+    Raises:
+        SyntaxError: The condition is not a valid Python expression.
+    """
+    # on its own line inside the parentheses, the condition can have
+    # leading spaces or a trailing comment just like it could with eval()
+    return eval(compile("lambda self: (\n" + cond + "\n)", name, "eval"), globals())
 
 def caluculate_field(recordClass, attr, rule):
     """
@@ -559,45 +915,34 @@ def caluculate_field(recordClass, attr, rule):
         recordClass (class): The class containing the variables
                              defined in the rule and attr.
         attr (string): The name of the class variable to update.
-        rule (string array): Defines the math to perform:
-            array[0]: Class variable name
-            array[1]: Operation to perform, either "+", "-", "/", or "*"
-            array[2]: Class variable name
+        rule (tuple): The math to perform, as resolved by the ColumnMap:
+            tuple[0]: Class variable name
+            tuple[1]: Operation as written in the json, either "+", "-", "/", or "*"
+            tuple[2]: Class variable name
+            tuple[3]: The operator function for tuple[1], None if not supported
     """
-    if len(rule) < 3:
-        return # bad definition in the json file
-    
-    field1 = rule[0]
-    math = rule[1]
-    field2 = rule[2]
-    if getattr(recordClass, field1, None) is not None \
-        and getattr(recordClass, field2, None) is not None:
+    field1, math, field2, operation = rule
+    values = recordClass.__dict__
+    value1 = values.get(field1)
+    value2 = values.get(field2)
+    if value1 is not None and value2 is not None:
         # we have all 3 the fields
-        string1 = isinstance(recordClass.__dict__[field1], str)
-        string2 = isinstance(recordClass.__dict__[field2], str)
-        if string1 or string2:
+        if type(value1) is str or type(value2) is str:
             # can't do math on strings
-            print("error: CalculateRules ", attr, "=", rule, " must be non-string inputs")
+            print("error: CalculateRules ", attr, "=", [field1, math, field2], " must be non-string inputs")
             return
-        if math == '+':
-            recordClass.__dict__[attr] = recordClass.__dict__[field1] + recordClass.__dict__[field2]
-        elif math == '-':
-            recordClass.__dict__[attr] = recordClass.__dict__[field1] - recordClass.__dict__[field2]
-        elif math == '*':
-            recordClass.__dict__[attr] = recordClass.__dict__[field1] * recordClass.__dict__[field2]
-        elif math == '/':
-            if field2 == 0:
-                print("Cannot divide by zero:", attr, rule, recordClass.get_formatted_string())
-            else:
-                recordClass.__dict__[attr] = recordClass.__dict__[field1] / recordClass.__dict__[field2]
-    elif getattr(recordClass, field1, None) is not None:
+        if operation is operator.truediv and value2 == 0:
+            print("Cannot divide by zero:", attr, [field1, math, field2], recordClass.get_formatted_string())
+        elif operation is not None:
+            values[attr] = operation(value1, value2)
+    elif value1 is not None:
         # field2 is missing
         # just set the result to field1
-        recordClass.__dict__[attr] = recordClass.__dict__[field1]
-    elif getattr(recordClass, field2, None) is not None:
+        values[attr] = value1
+    elif value2 is not None:
         # field1 is missing
         # just set the result to field2
-        recordClass.__dict__[attr] = recordClass.__dict__[field2]
+        values[attr] = value2
 
 def translate_field(recordClass, attr, rule):
     if len(rule) < 2:
@@ -608,26 +953,6 @@ def translate_field(recordClass, attr, rule):
         # condition is true
         recordClass.__dict__[attr] = newval
 
-def is_float(text):
-    """
-    Tests whether the passed 'text' can be converted to float.
-
-    Args:
-        text (string): Text to test.
-
-    Returns:
-        True if 'text' can convert to a float.
-        False if 'text' does not convert to a float.
-    """
-    # check for nan/infinity etc.
-    if text.isalpha():
-        return False
-    try:
-        locale.atof(text)
-        return True
-    except ValueError:
-        return False
-
 def convert():
     """
     Parses command line and JSON definiton file, verifies inputs,
@@ -642,6 +967,8 @@ def convert():
                     action ='store', help ='CSV file to convert')
     parser.add_argument('-o', dest ='qifFile', 
                     action ='store', help ='QIF file to create')
+    parser.add_argument('--chunk-size', dest='chunkSize', type=int, default=default_chunk_size,
+                    action ='store', help ='transactions held in memory before they are written out (default %(default)s)')
     parser.add_argument(dest='jsonFile',
                     action ='store', help ='JSON conversion definition file')
     args = parser.parse_args()
@@ -717,21 +1044,26 @@ def convert():
     if not os.path.exists(os.path.dirname(os.path.abspath(toPath))):
         print("error: QIF directory does not exist:", toFolder)
         params_ok = False
-    if not os.path.isfile(defPath):
-        print("error: Could not find json file ", defPath)
+    # (the json file was already checked before it was read)
+
+    if args.chunkSize < 1:
+        print("error: --chunk-size must be at least 1")
         params_ok = False
 
     if not params_ok:
         exit(1)
     
     try:
-        fromfile = open(fromPath,'r')
+        # large buffer so the csv reader pulls the file in a few big reads,
+        # newline='' leaves the line endings to the csv reader (no universal newline translation)
+        fromfile = open(fromPath,'r', buffering=1<<20, newline='')
     except:
         print ('\n** Exception reading ' + fromPath)
         exit(1)
 
     try:
-        tofile = open(toPath,'w')
+        # large buffer so the QIF output goes out in a few big writes
+        tofile = open(toPath,'wb', buffering=1<<20)
     except:
         print ('\n** Exception writing ' + toPath)
         exit(1)
@@ -742,10 +1074,11 @@ def convert():
         print("Formating is described here: https://docs.python.org/3/library/datetime.html#strftime-and-strptime-behavior")
         exit(1)
 
-    readCsv(fromfile, tofile, colmap)
+    readCsv(fromfile, tofile, colmap, args.chunkSize)
 
     fromfile.close()
     tofile.close()
+    colmap.convert_date.cache_clear()
 
 
 